@@ -0,0 +1,65 @@
+import gc
+import time
+import tyro
+import consts
+import random
+import tracemalloc
+
+from dataclasses import dataclass
+from replays import Replay, ReplayBatch
+
+
+@dataclass
+class Args:
+    n: int = 1000000
+    """Number of queued replays"""
+
+
+@dataclass
+class DictReplay:
+    """Replay as it used to be, with a __dict__ per object."""
+    id: str
+    format: str
+    rating: int
+
+
+def entries(n: int):
+    """Fake search.json entries, each with its own strings as after json decoding."""
+    random.seed(0)
+    for i in range(n):
+        format = random.choice(consts.FORMATS)
+        yield {
+            "id": f"{consts.to_compact_notation(format)}-{2200000000 + i}",
+            "format": "".join(format),  # a new string, as json.loads returns
+            "rating": random.choice([None, random.randint(1000, 2000)]),
+        }
+
+
+def measure(name: str, build, n: int) -> list:
+    gc.collect()
+    tracemalloc.start()
+    replays = build(entries(n))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in replays:
+        pass
+    iterate = time.perf_counter() - start
+    del replays
+    return [name, size / 2**20, size / n, iterate]
+
+
+if __name__ == "__main__":
+    args = tyro.cli(Args)
+
+    rows = [
+        measure("list of dataclass", lambda data: [DictReplay(d["id"], d["format"], d["rating"]) for d in data], args.n),
+        measure("list of slots", lambda data: [Replay(d["id"], d["format"], d["rating"]) for d in data], args.n),
+        measure("ReplayBatch", ReplayBatch.from_search, args.n),
+    ]
+
+    print(f"| {'Representation':<18} | {'MB':>7} | {'B/replay':>8} | {'iterate s':>9} |")
+    print(f"|{'-' * 20}|{'-' * 9}|{'-' * 10}|{'-' * 11}|")
+    for name, mb, per_replay, iterate in rows:
+        print(f"| {name:<18} | {mb:7.1f} | {per_replay:8.1f} | {iterate:9.2f} |")
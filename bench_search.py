@@ -0,0 +1,126 @@
+import os
+import time
+import tyro
+import random
+import logger
+import logging
+import functools
+import itertools
+import tempfile
+import statistics
+
+from dataclasses import dataclass
+from db import DB
+
+
+logger.setup(30)
+logger = logging.getLogger(__name__)
+
+FORMATS = ["[Gen 9] OU", "[Gen 9] Random Battle", "[Gen 9] VGC 2025 Reg G"]
+
+
+@dataclass
+class Args:
+    logs: int = 300000
+    """Number of synthetic logs in the benchmark database"""
+
+    players: int = 50000
+    """Number of distinct players"""
+
+    species: int = 400
+    """Number of distinct species"""
+
+    moves: int = 600
+    """Number of distinct moves"""
+
+    queries: int = 200
+    """Queries per scenario"""
+
+    limit: int = 100
+    """Page size"""
+
+
+@functools.cache
+def cum_weights(n: int) -> list:
+    return list(itertools.accumulate(1 / i for i in range(1, n + 1)))
+
+
+def zipf(n: int, k: int) -> list:
+    """k picks among n names, the i-th being 1/i as frequent as the first, like usage stats."""
+    return random.choices(range(n), cum_weights=cum_weights(n), k=k)
+
+
+def synthetic_log(args: Args) -> str:
+    lines = []
+    for side, player in zip(("p1", "p2"), random.sample(range(args.players), 2)):
+        lines.append(f"|player|{side}|Player {player}|")
+        for species in set(zipf(args.species, 6)):
+            lines.append(f"|poke|{side}|Species {species}, L50|")
+            for move in set(zipf(args.moves, 4)):
+                lines.append(f"|move|{side}a: Nick|Move {move}|{side}a: Nick")
+    return "\n".join(lines)
+
+
+def fill(db: DB, args: Args, batch: int = 10000):
+    for start in range(0, args.logs, batch):
+        db.add_many(
+            [
+                (f"gen9-{i:09d}", FORMATS[i % len(FORMATS)], random.randint(1000, 2000), synthetic_log(args))
+                for i in range(start, min(start + batch, args.logs))
+            ]
+        )
+
+
+def run(name: str, db: DB, queries: list) -> list:
+    conn = db.connect(readonly=True)
+    latencies = []
+    found = 0
+    for terms, filters in queries:
+        start = time.perf_counter()
+        found += len(db.filter(terms=terms, conn=conn, **filters))
+        latencies.append(1000 * (time.perf_counter() - start))
+    conn.close()
+    q = statistics.quantiles(latencies, n=100)
+    return [name, q[49], q[94], q[98], found / len(queries)]
+
+
+if __name__ == "__main__":
+    args = tyro.cli(Args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = DB(path, index=True)
+        start = time.time()
+        fill(db, args)
+        conn = db.connect()
+        terms = conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+        conn.close()
+        print(f"Filled {path} with {args.logs} logs, {terms} terms in {time.time() - start:.0f}s ({db.size() / 2**20:.0f} MB)")
+
+        def species(popular=True):
+            return ("species", f"species{random.randrange(10) if popular else random.randrange(50, args.species)}")
+
+        def move(popular=True):
+            return ("move", f"move{random.randrange(10) if popular else random.randrange(50, args.moves)}")
+
+        def player():
+            return ("player", f"player{random.randrange(args.players)}")
+
+        page = {"limit": args.limit}
+        high = {"limit": args.limit, "format": FORMATS[0], "rating_min": 1800}
+        scenarios = {
+            "species": lambda: ([species()], page),
+            "species + move": lambda: ([species(), move()], page),
+            "species + move, fmt/rating": lambda: ([species(), move()], high),
+            "2 species + 2 moves": lambda: ([species(), species(), move(), move()], page),
+            "rare species + move": lambda: ([species(False), move(False)], page),
+            "popular + rare species": lambda: ([species(), species(False)], page),
+            "player": lambda: ([player()], page),
+            "player + species": lambda: ([player(), species()], page),
+        }
+        rows = [run(name, db, [make() for _ in range(args.queries)]) for name, make in scenarios.items()]
+
+    print(f"| {'Scenario':<28} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'rows':>5} |")
+    print(f"|{'-' * 30}|{'-' * 9}|{'-' * 9}|{'-' * 9}|{'-' * 7}|")
+    for name, p50, p95, p99, found in rows:
+        print(f"| {name:<28} | {p50:7.2f} | {p95:7.2f} | {p99:7.2f} | {found:5.0f} |")
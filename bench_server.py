@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import tyro
+import random
+import logger
+import logging
+import requests
+import tempfile
+import threading
+import statistics
+import subprocess
+
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from db import DB
+
+
+logger.setup()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Args:
+    logs: int = 20000
+    """Number of synthetic logs in the benchmark database"""
+
+    log_size: int = 12000
+    """Size (in bytes) of each synthetic log"""
+
+    requests: int = 5000
+    """Requests per scenario"""
+
+    clients: int = 8
+    """Concurrent client threads"""
+
+    port: int = 8089
+    """Port of the benchmarked server"""
+
+
+def fill(db: DB, n: int, log_size: int):
+    formats = ["[Gen 9] OU", "[Gen 9] Random Battle", "[Gen 9] VGC 2025 Reg G"]
+    conn = db.connect()
+    conn.executemany(
+        "INSERT INTO logs (id, format, rating, log) VALUES (?, ?, ?, ?)",
+        (
+            (f"gen9-{i:09d}", formats[i % len(formats)], random.randint(1000, 2000), "|" * log_size)
+            for i in range(n)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(name: str, urls: list, clients: int) -> list:
+    local = threading.local()
+
+    def fetch(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.get(urls[i])
+        response.raise_for_status()
+        return time.perf_counter() - start, len(response.content)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(fetch, range(len(urls))))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    q = statistics.quantiles(latencies, n=100)
+    return [name, len(urls) / elapsed, q[49], q[94], q[98], sum(r[1] for r in results) / elapsed / 2**20]
+
+
+if __name__ == "__main__":
+    args = tyro.cli(Args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db = DB(path)
+        fill(db, args.logs, args.log_size)
+        logger.info(f"Filled {path} with {args.logs} logs ({db.size() / 2**20:.0f} MB)")
+
+        server = subprocess.Popen(
+            [sys.executable, "server.py", "--db", path, "--port", str(args.port), "--level", "30"]
+        )
+        base = f"http://127.0.0.1:{args.port}"
+        for _ in range(100):
+            try:
+                requests.get(f"{base}/stats")
+                break
+            except requests.ConnectionError:
+                time.sleep(.1)
+
+        ids = [f"gen9-{i:09d}" for i in range(args.logs)]
+        hot = ids[:500]
+        cold = random.sample(ids, min(args.requests, args.logs))
+        rows = [
+            run("get by id (cold)", [f"{base}/logs/{id}" for id in cold], args.clients),
+            run("get by id (hot)", [f"{base}/logs/{random.choice(hot)}" for _ in range(args.requests)], args.clients),
+            run(
+                "batch get (50 ids)",
+                [f"{base}/logs?" + "&".join(f"id={id}" for id in random.sample(ids, 50)) for _ in range(args.requests // 10)],
+                args.clients,
+            ),
+            run(
+                "filter page (100)",
+                [
+                    f"{base}/search?format=[Gen 9] OU&rating_min=1500&limit=100&after={random.choice(ids)}"
+                    for _ in range(args.requests)
+                ],
+                args.clients,
+            ),
+        ]
+        server.terminate()
+        server.wait()
+
+    print(f"| {'Scenario':<20} | {'req/s':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7} | {'MB/s':>7} |")
+    print(f"|{'-' * 22}|{'-' * 10}|{'-' * 9}|{'-' * 9}|{'-' * 9}|{'-' * 9}|")
+    for name, rps, p50, p95, p99, mbps in rows:
+        print(f"| {name:<20} | {rps:8.0f} | {p50:7.2f} | {p95:7.2f} | {p99:7.2f} | {mbps:7.1f} |")
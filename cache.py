@@ -0,0 +1,176 @@
+import re
+import time
+import sqlite3
+import logging
+import requests
+import threading
+
+from contextlib import closing
+from requests.structures import CaseInsensitiveDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    On-disk cache of GET responses keyed by url.
+
+    A cached response is served without any request until it expires, then
+    it is revalidated with a conditional request (If-None-Match /
+    If-Modified-Since) when the server gave an ETag or a Last-Modified,
+    so an unchanged page costs a 304 instead of the whole body.
+    Responses are fresh for the Cache-Control max-age if any, otherwise for
+    the `ttl` of their endpoint when the server gave no validators.
+    The least recently used responses are evicted above `max_bytes`.
+    """
+
+    def __init__(self, name: str = "cache.db", max_bytes: int = 512 * 2**20, ttl: dict = None) -> None:
+        self.name = name
+        self.max_bytes = max_bytes
+        # seconds a response without validators is reused, by url substring
+        self.ttl = ttl or {"/ladder/": 600, "search.json": 30}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.create_table()
+
+    def connect(self):
+        return sqlite3.connect(self.name, timeout=30)
+
+    def create_table(self):
+        """Initialize responses table."""
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                expires REAL,
+                accessed REAL,
+                size INTEGER
+            )
+        """
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        conn.commit()
+        conn.close()
+
+    def count(self, metric: str):
+        with self.lock:
+            setattr(self, metric, getattr(self, metric) + 1)
+
+    def get(self, url: str, fetch=requests.get) -> requests.Response:
+        """
+        Return the response of url, from the cache when possible.
+        - fetch: function sending the request, e.g. governor.get
+        The response `from_cache` is True when no request was sent.
+        """
+        now = time.time()
+        with closing(self.connect()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT body, content_type, etag, last_modified, expires FROM responses WHERE url = ?", (url,)
+            )
+            row = cursor.fetchone()
+
+            if row is not None and row[4] > now:
+                cursor.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, url))
+                conn.commit()
+                self.count("hits")
+                return self.response(url, row[0], row[1], from_cache=True)
+
+            headers = {}
+            if row is not None and row[2]:
+                headers["If-None-Match"] = row[2]
+            if row is not None and row[3]:
+                headers["If-Modified-Since"] = row[3]
+            response = fetch(url, headers=headers) if headers else fetch(url)
+
+            if response.status_code == 304 and row is not None:
+                cursor.execute(
+                    "UPDATE responses SET expires = ?, accessed = ? WHERE url = ?",
+                    (now + self.lifetime(url, response, validated=True), now, url),
+                )
+                conn.commit()
+                self.count("revalidated")
+                return self.response(url, row[0], row[1], from_cache=False)
+
+            self.count("misses")
+            response.from_cache = False
+            cache_control = response.headers.get("Cache-Control", "")
+            if response.status_code == 200 and "no-store" not in cache_control:
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO responses
+                    (url, body, content_type, etag, last_modified, expires, accessed, size)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        url,
+                        response.content,
+                        response.headers.get("Content-Type"),
+                        etag,
+                        last_modified,
+                        now + self.lifetime(url, response, validated=bool(etag or last_modified)),
+                        now,
+                        len(response.content),
+                    ),
+                )
+                conn.commit()
+                self.evict(conn)
+            return response
+
+    def lifetime(self, url: str, response: requests.Response, validated: bool) -> float:
+        """Seconds the response is served without asking the server."""
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        if match:
+            return int(match.group(1))
+        if validated:
+            return 0  # revalidate every time, cheap with a 304
+        return next((ttl for part, ttl in self.ttl.items() if part in url), 0)
+
+    def evict(self, conn):
+        """Delete the least recently used responses above max_bytes."""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(SUM(size), 0) FROM responses")
+        excess = cursor.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        cursor.execute("SELECT url, size FROM responses ORDER BY accessed")
+        urls = []
+        for url, size in cursor:
+            if excess <= 0:
+                break
+            urls.append((url,))
+            excess -= size
+        conn.executemany("DELETE FROM responses WHERE url = ?", urls)
+        conn.commit()
+        with self.lock:
+            self.evicted += len(urls)
+
+    @staticmethod
+    def response(url: str, body: bytes, content_type: str, from_cache: bool) -> requests.Response:
+        response = requests.Response()
+        response.from_cache = from_cache
+        response.url = url
+        response.status_code = 200
+        response._content = body
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type or ""})
+        response.encoding = "utf-8"
+        return response
+
+    def stats(self) -> dict:
+        """Hits (no request), revalidated (304), misses (full body) and evictions."""
+        with self.lock:
+            return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses, "evicted": self.evicted}
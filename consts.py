@@ -36,5 +36,12 @@ def to_compact_notation(bracket_format):
     compact_format = f"gen{gen}{format_name.lower().replace(' ', '')}"
     return compact_format
 
+def to_id(name: str) -> str:
+    """
+    Convert a name (username, pokemon, move) to its showdown id
+    e.g., 'Some Player' -> 'someplayer', 'Swords Dance' -> 'swordsdance'
+    """
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
 if __name__ == "__main__":
     print(to_compact_notation("[Gen 9] VGC 2025 Reg G"))
\ No newline at end of file
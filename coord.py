@@ -0,0 +1,150 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Leases:
+    """
+    Lease table shared by crawler workers, so N copies of `cron.py` split the
+    work instead of repeating it.
+
+    Every unit of work (a search page, a player search, a source sweep) has a
+    key. A worker claims keys before doing the work:
+    - while running, the lease expires after `ttl` seconds unless the owner
+      heartbeats, so the work of a dead worker is picked up by the others.
+    - once done, the lease is kept until the end of a cooldown, so nobody
+      repeats the same request before the next scheduled sweep.
+
+    The table lives in a local SQLite file, which is enough for processes on
+    the same host. For several hosts, replace this class with one backed by a
+    shared store exposing the same `claim`/`heartbeat`/`release` methods.
+    """
+
+    def __init__(self, name: str = "crawl.db", worker: str = None, ttl: float = 60) -> None:
+        self.name = name
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        self.create_table()
+        self.reset()
+
+    def connect(self):
+        # concurrent workers wait for each other instead of failing
+        return sqlite3.connect(self.name, timeout=30, isolation_level=None)
+
+    def create_table(self):
+        """Initialize lease table."""
+
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY,
+                worker TEXT,
+                expires REAL,
+                done INTEGER DEFAULT 0
+            )
+        """
+        )
+        conn.close()
+
+    def reset(self):
+        """
+        Drop the running leases left by a previous process with the same
+        worker name, otherwise its heartbeats would keep them forever.
+        """
+
+        conn = self.connect()
+        cursor = conn.execute("DELETE FROM leases WHERE worker = ? AND done = 0", (self.worker,))
+        if cursor.rowcount:
+            logger.info(f"Worker {self.worker} dropped {cursor.rowcount} leases of its previous run")
+        conn.close()
+
+    def acquire(self, keys: list) -> list:
+        """Try to lease the given keys, return the ones acquired by this worker."""
+
+        now = time.time()
+        acquired = []
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        for key in keys:
+            cursor = conn.execute(
+                """
+                INSERT INTO leases (key, worker, expires, done) VALUES (?, ?, ?, 0)
+                ON CONFLICT (key) DO UPDATE SET
+                    worker = excluded.worker, expires = excluded.expires, done = 0
+                WHERE leases.expires < ?
+            """,
+                (key, self.worker, now + self.ttl, now),
+            )
+            if cursor.rowcount:
+                acquired.append(key)
+        conn.execute("COMMIT")
+        conn.close()
+        return acquired
+
+    def finish(self, keys: list, cooldown: float):
+        """Mark leased keys as done, nobody can claim them for `cooldown` seconds."""
+
+        conn = self.connect()
+        conn.executemany(
+            "UPDATE leases SET expires = ?, done = 1 WHERE key = ? AND worker = ?",
+            ((time.time() + cooldown, key, self.worker) for key in keys),
+        )
+        conn.close()
+
+    def release(self, keys: list):
+        """Give back leased keys that were not completed."""
+
+        conn = self.connect()
+        conn.executemany(
+            "DELETE FROM leases WHERE key = ? AND worker = ? AND done = 0",
+            ((key, self.worker) for key in keys),
+        )
+        conn.close()
+
+    def heartbeat(self):
+        """Extend every running lease held by this worker."""
+
+        conn = self.connect()
+        cursor = conn.execute(
+            "UPDATE leases SET expires = ? WHERE worker = ? AND done = 0",
+            (time.time() + self.ttl, self.worker),
+        )
+        logger.debug(f"Worker {self.worker} extended {cursor.rowcount} leases")
+        conn.close()
+
+    def purge(self):
+        """Delete expired leases."""
+
+        conn = self.connect()
+        cursor = conn.execute("DELETE FROM leases WHERE expires < ?", (time.time(),))
+        logger.debug(f"Purged {cursor.rowcount} expired leases")
+        conn.close()
+
+    def claim(self, items, key, cooldown: float, batch: int = 50):
+        """
+        Yield the items this worker leased, leasing them `batch` at a time.
+        An item is finished, with the given cooldown, once the next one is
+        requested; if the consumer stops early the items not finished are released.
+        - items: iterable of work items
+        - key: function mapping an item to its lease key
+        """
+        items = list(items)
+        for i in range(0, len(items), batch):
+            keys = {key(item): item for item in items[i:i + batch]}
+            acquired = self.acquire(list(keys))
+            if len(acquired) < len(keys):
+                logger.debug(f"Skipping {len(keys) - len(acquired)} items leased by other workers")
+            for n, k in enumerate(acquired):
+                try:
+                    yield keys[k]
+                except GeneratorExit:
+                    self.release(acquired[n:])
+                    raise
+                self.finish([k], cooldown)
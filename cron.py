@@ -3,12 +3,19 @@ import tyro
 import logger
 import consts
 import logging
+import scraper
 import schedule
 import threading
+import functools
 
 from dataclasses import dataclass
 from scraper import scrape_log, scrape_recents, scrape_formats, scrape_ladders, scrape_members, scrape_roomlst
 from db import DB
+from coord import Leases
+from ingest import IngestQueue
+from governor import governor
+from cache import ResponseCache
+from players import PlayerIndex
 
 
 @dataclass
@@ -19,6 +26,7 @@ class Wait:
     ladders: int = 7200 # seconds
     members: int = 1800 # seconds
     roomlst: int = 300 # seconds
+    rates: int = 60 # seconds, log the request rates
 
 
 @dataclass
@@ -32,6 +40,42 @@ class Args:
     level: int = 20
     """Logging level. Default INFO"""
 
+    worker: str | None = None
+    """Worker name, defaults to <hostname>-<pid>"""
+
+    coord: str = "crawl.db"
+    """Lease database shared by the workers"""
+
+    ttl: int = 60
+    """Seconds a lease survives without heartbeats"""
+
+    shard: bool = False
+    """Write logs to a per-worker logs-<worker>.db instead of the shared logs.db"""
+
+    batch: int = 50
+    """Replays fetched and stored per transaction"""
+
+    top: int = 100
+    """Players searched per format by each player source run"""
+
+    stale: int = 21600
+    """Seconds before a searched player is searched again"""
+
+    cache: str = "cache.db"
+    """Response cache of the search and ladder pages"""
+
+    cache_size: int = 512 * 2**20
+    """Max size of the response cache (in bytes)"""
+
+    index: bool = False
+    """Create the search index (players, species, moves) of the added logs, an existing one is always kept up to date"""
+
+    url: str = scraper.URL
+    """Replay server, e.g. a local mock server"""
+
+    ladder_url: str = scraper.LADDER_URL
+    """Ladder server, e.g. a local mock server"""
+
 args = tyro.cli(Args)
 
 
@@ -39,59 +83,76 @@ logger.setup(args.level)
 logger = logging.getLogger(__name__)
 
 
-db = DB()
+scraper.URL = args.url
+scraper.LADDER_URL = args.ladder_url
+scraper.cache = ResponseCache(args.cache, max_bytes=args.cache_size)
+leases = Leases(args.coord, worker=args.worker, ttl=args.ttl)
+db = DB(f"logs-{leases.worker}.db" if args.shard else "logs.db", index=args.index)
+index = PlayerIndex(db, top=args.top, stale=args.stale)
 
 
-# global list of replays that is filled asynchronously
+def claim(wait: int):
+    """
+    Lease requests for a source running every `wait` seconds. Requests done
+    by any worker are not repeated before the next run (a bit earlier, so
+    that runs scheduled exactly `wait` seconds apart are not skipped).
+    """
+    return functools.partial(leases.claim, cooldown=.9 * wait)
+
+
+# persistent queue of replays that is filled asynchronously
 # each replay has a battle-id, a format and a rating
-# the script loops forever and add replays if there are any
-# scheduled jobs fill asyncronously the replays list
-replays = []
-replays_lock = threading.Lock()
+# scheduled jobs push the replays they find, add_logs fetches their logs
+# the queue lives on disk, a restart resumes from the pending replays
+queue = IngestQueue(args.coord)
+
 
 def _scrape_recents():
     logger.info(f"Starting job in thread: {threading.current_thread().name}")
-    new_replays = scrape_recents()
-    with replays_lock:
-        replays.extend(new_replays)
+    scrape_recents(claim=claim(args.wait.recents), push=queue.push, index=index)
 
 
 def _scrape_formats():
     logger.info(f"Starting job in thread: {threading.current_thread().name}")
-    new_replays = scrape_formats()
-    with replays_lock:
-        replays.extend(new_replays)
+    scrape_formats(claim=claim(args.wait.formats), push=queue.push, index=index)
 
 
 def _scrape_ladders():
     logger.info(f"Starting job in thread: {threading.current_thread().name}")
-    new_replays = scrape_ladders()
-    with replays_lock:
-        replays.extend(new_replays)
+    scrape_ladders(claim=claim(args.wait.ladders), push=queue.push, index=index)
 
 
 def _scrape_members():
     logger.info(f"Starting job in thread: {threading.current_thread().name}")
-    new_replays = scrape_members()
-    with replays_lock:
-        replays.extend(new_replays)
+    scrape_members(claim=claim(args.wait.members), push=queue.push, index=index)
 
 
 def _scrape_roomlst():
     logger.info(f"Starting job in thread: {threading.current_thread().name}")
-    new_replays = scrape_roomlst()
-    with replays_lock:
-        replays.extend(new_replays)
+    scrape_roomlst(claim=claim(args.wait.roomlst), push=queue.push, index=index)
 
 
 def add_logs():
     while True:
-        with replays_lock:
-            if not replays:
-                return
-            r = replays.pop()
-        if not db.exists(r.id):
-            db.add(r.id, r.format, r.rating, scrape_log(r.id))
+        batch = queue.take(args.batch)
+        if not batch:
+            return
+        existing = db.existing(batch.ids())
+        rows, stored, failed = [], [], []
+        for id, format, rating in batch:
+            if id in existing:
+                stored.append(id)
+                continue
+            log = scrape_log(id)
+            if log is None:
+                failed.append(id)
+            else:
+                rows.append((id, format, rating, log))
+                stored.append(id)
+        db.add_many(rows)
+        index.seen_logs((format, log) for _, format, _, log in rows)
+        queue.done(stored)
+        queue.retry(failed)
 
 
 def run_threaded(job_func):
@@ -108,6 +169,11 @@ run_threaded(_scrape_roomlst)
 
 
 schedule.every(args.wait.addlogs).seconds.do(run_threaded, add_logs)
+schedule.every(args.ttl // 3).seconds.do(run_threaded, leases.heartbeat)
+schedule.every(args.ttl * 10).seconds.do(run_threaded, leases.purge)
+schedule.every(args.wait.rates).seconds.do(
+    lambda: logger.info(f"Request rates {governor.rates()} cache {scraper.cache.stats()}")
+)
 schedule.every(args.wait.recents).seconds.do(run_threaded, _scrape_recents)
 schedule.every(args.wait.formats).seconds.do(run_threaded, _scrape_formats)
 schedule.every(args.wait.ladders).seconds.do(run_threaded, _scrape_ladders)
@@ -117,8 +183,9 @@ schedule.every(args.wait.roomlst).seconds.do(run_threaded, _scrape_roomlst)
 
 if __name__ == "__main__":
 
-    logger.info("Scraper started")
+    logger.info(f"Scraper started as worker {leases.worker}")
     db.stats()
+    logger.info(f"Resuming with queue {queue.stats()}")
 
     while True:
         schedule.run_pending()
@@ -5,17 +5,41 @@ import logging
 import tabulate
 import pandas as pd
 
+from search import SearchIndex
+
 
 logger = logging.getLogger(__name__)
 
 
 class DB:
-    def __init__(self, name: str = "logs.db") -> None:
+    def __init__(self, name: str = "logs.db", index: bool = False) -> None:
+        """
+        - name: path of the database
+        - index: create the search index (search.SearchIndex) and keep it up
+          to date with the logs added. An existing index is always kept up to date.
+        """
         self.name = name
         self.create_table()
+        conn = self.connect()
+        indexed = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'terms'").fetchone()
+        conn.close()
+        if indexed and not index:
+            logger.info(f"{name} has a search index, indexing the logs added")
+        self.index = SearchIndex(self) if index or indexed else None
 
-    def connect(self):
-        return sqlite3.connect(self.name)
+    def connect(self, readonly: bool = False, check_same_thread: bool = True):
+        """
+        Open a connection to the database.
+        - readonly: open the file in read-only mode, used by readers
+          that must never take a write lock (e.g., server.py)
+        - check_same_thread: set False to share the connection in a pool
+        """
+        if readonly:
+            return sqlite3.connect(
+                f"file:{self.name}?mode=ro", uri=True, check_same_thread=check_same_thread
+            )
+        # concurrent workers wait for the write lock instead of failing
+        return sqlite3.connect(self.name, timeout=30, check_same_thread=check_same_thread)
 
     def size(self) -> float:
         return os.path.getsize(self.name)
@@ -35,6 +59,10 @@ class DB:
             )
         """
         )
+        # readers use keyset pagination over (format, id)
+        cursor.execute("CREATE INDEX IF NOT EXISTS logs_format_id ON logs (format, id)")
+        # WAL lets readers run while cron.py is writing
+        cursor.execute("PRAGMA journal_mode=WAL")
         conn.commit()
         conn.close()
 
@@ -51,12 +79,43 @@ class DB:
             """,
                 (log_id, format, rating, log),
             )
+            if self.index is not None:
+                self.index.add([(log_id, log)], conn)
             conn.commit()
             logger.info(f"Log {log_id} added successfully.")
         except sqlite3.IntegrityError:
             logger.debug(f"log ID ({log_id}) already exists.")
         conn.close()
 
+    def add_many(self, rows: list):
+        """Add (id, format, rating, log) rows in a single transaction, skipping present ids."""
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO logs (id, format, rating, log) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        added = cursor.rowcount
+        if self.index is not None:
+            self.index.add(((id, log) for id, _, _, log in rows), conn)
+        conn.commit()
+        logger.info(f"Added {added} logs.")
+        conn.close()
+
+    def existing(self, ids: list) -> set:
+        """Return the subset of ids already in the database."""
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        found = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            cursor.execute("SELECT id FROM logs WHERE id IN ({})".format(",".join("?" * len(chunk))), chunk)
+            found.update(row[0] for row in cursor.fetchall())
+        conn.close()
+        return found
+
     def exists(self, id: str) -> bool:
         conn = self.connect()
         cursor = conn.cursor()
@@ -65,6 +124,114 @@ class DB:
         conn.close()
         return exists
 
+    # --------------------------------------------------
+    # Queries
+    # --------------------------------------------------
+    def get(self, id: str, conn=None):
+        """Return the (id, format, rating, log) row of a log, None if missing."""
+        own = conn is None
+        conn = conn or self.connect(readonly=True)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, format, rating, log FROM logs WHERE id = ?", (id,))
+        row = cursor.fetchone()
+        if own:
+            conn.close()
+        return row
+
+    def get_many(self, ids: list, conn=None) -> list:
+        """Return the (id, format, rating, log) rows of the given ids, missing ones are skipped."""
+        return list(self.iter_many(ids, conn))
+
+    def iter_many(self, ids: list, conn=None):
+        """Yield the (id, format, rating, log) rows of the given ids as they are read, in no particular order."""
+        own = conn is None
+        conn = conn or self.connect(readonly=True)
+        cursor = conn.cursor()
+        try:
+            # stay below SQLITE_MAX_VARIABLE_NUMBER
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cursor.execute(
+                    "SELECT id, format, rating, log FROM logs WHERE id IN ({})".format(",".join("?" * len(chunk))),
+                    chunk,
+                )
+                yield from cursor
+        finally:
+            if own:
+                conn.close()
+
+    def filter(
+        self,
+        format: str = None,
+        rating_min: int = None,
+        rating_max: int = None,
+        after: str = "",
+        limit: int = 100,
+        terms: list = (),
+        conn=None,
+    ) -> list:
+        """Return up to `limit` (id, format, rating) rows ordered by id, see iter_filter."""
+        return list(self.iter_filter(format, rating_min, rating_max, after, limit, terms, conn))
+
+    def iter_filter(
+        self,
+        format: str = None,
+        rating_min: int = None,
+        rating_max: int = None,
+        after: str = "",
+        limit: int = 100,
+        terms: list = (),
+        conn=None,
+    ):
+        """
+        Yield up to `limit` (id, format, rating) rows ordered by id, as they are read.
+
+        Parameters:
+        - format: keep only logs of this format (optional).
+        - rating_min, rating_max: inclusive rating bounds (optional).
+        - after: keyset cursor, only ids greater than this are returned.
+        - limit: page size.
+        - terms: (kind, term) pairs of the search index every log must contain.
+        """
+        own = conn is None
+        conn = conn or self.connect(readonly=True)
+        cursor = conn.cursor()
+
+        if len(terms) > 1:
+            # the rarest term drives the join, counting at most 10000 ids of each
+            probe = "SELECT COUNT(*) FROM (SELECT 1 FROM terms WHERE kind = ? AND term = ? AND id > ? LIMIT 10000)"
+            terms = sorted(terms, key=lambda term: cursor.execute(probe, (*term, after)).fetchone()[0])
+        if terms:
+            # walk the primary key of the first term in id order, joining the
+            # other terms and the logs on id, so only matching ids are read
+            query = "SELECT logs.id, logs.format, logs.rating FROM terms t1"
+            for i in range(2, len(terms) + 1):
+                query += f" JOIN terms t{i} ON t{i}.kind = ? AND t{i}.term = ? AND t{i}.id = t1.id"
+            query += " JOIN logs ON logs.id = t1.id WHERE t1.kind = ? AND t1.term = ? AND t1.id > ?"
+            params = [value for term in terms[1:] for value in term] + [*terms[0], after]
+            order = "t1.id"
+        else:
+            query = "SELECT id, format, rating FROM logs WHERE id > ?"
+            params = [after]
+            order = "id"
+        if format is not None:
+            query += " AND logs.format = ?"
+            params.append(format)
+        if rating_min is not None:
+            query += " AND logs.rating >= ?"
+            params.append(rating_min)
+        if rating_max is not None:
+            query += " AND logs.rating <= ?"
+            params.append(rating_max)
+        query += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        try:
+            yield from cursor.execute(query, params)
+        finally:
+            if own:
+                conn.close()
+
     # --------------------------------------------------
     # Statistics
     # --------------------------------------------------
@@ -0,0 +1,149 @@
+import time
+import logging
+import requests
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate is tuned with additive increase / multiplicative
+    decrease: every good response adds `increase` requests per second, a
+    throttled (429), failed (5xx) or slow response halves the rate.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float = .2,
+        max_rate: float = 50,
+        increase: float = .05,
+        decrease: float = .5,
+        latency: float = 2.0,
+        cooldown: float = 5.0,
+    ) -> None:
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency = latency  # seconds, slower responses count as congestion
+        self.cooldown = cooldown  # seconds between two decreases
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.requests = 0
+        self.throttled = 0  # 429 and 5xx responses
+        self.slow = 0  # responses slower than `latency`
+        self.errors = 0  # timeouts and connection errors
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # at most one second of burst
+                self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def success(self, elapsed: float):
+        if elapsed > self.latency:
+            with self.lock:
+                self.slow += 1
+            self.slow_down()
+            return
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def failure(self, retry_after: float = 0):
+        """A throttled (429) or failed (5xx) response."""
+        with self.lock:
+            self.throttled += 1
+        self.slow_down(retry_after)
+
+    def error(self):
+        """A request that timed out or could not connect."""
+        with self.lock:
+            self.errors += 1
+        self.slow_down()
+
+    def slow_down(self, retry_after: float = 0):
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + retry_after)
+            # responses to requests already in flight report the same congestion
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            logger.warning(f"Slowing down to {self.rate:.2f} req/s")
+
+
+class Governor:
+    """
+    Process-wide rate governor, every request to the replay servers goes
+    through `get`, which waits for a token of the endpoint bucket and feeds
+    the response status and latency back to it.
+    """
+
+    def __init__(self, timeout: float = 30) -> None:
+        self.timeout = timeout  # seconds, default for every request
+        self.buckets = {
+            "search": TokenBucket(rate=2),
+            "log": TokenBucket(rate=10),
+            "ladder": TokenBucket(rate=1),
+        }
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        path = url.split("?")[0]
+        if "/ladder/" in path:
+            return "ladder"
+        if path.endswith(".log"):
+            return "log"
+        return "search"
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        bucket = self.buckets[self.endpoint(url)]
+        bucket.acquire()
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.monotonic()
+        try:
+            response = requests.get(url, **kwargs)
+        except (requests.Timeout, requests.ConnectionError):
+            bucket.error()
+            raise
+        elapsed = time.monotonic() - start
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("Retry-After", "")
+            bucket.failure(float(retry_after) if retry_after.isdigit() else 0)
+        else:
+            bucket.success(elapsed)
+        return response
+
+    def rates(self) -> dict:
+        """Current rate (req/s), sent, throttled, slow and failed requests of each endpoint."""
+        return {
+            name: {
+                "rate": round(b.rate, 2),
+                "requests": b.requests,
+                "throttled": b.throttled,
+                "slow": b.slow,
+                "errors": b.errors,
+            }
+            for name, b in self.buckets.items()
+        }
+
+
+governor = Governor()
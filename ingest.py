@@ -0,0 +1,132 @@
+import time
+import consts
+import sqlite3
+import logging
+
+from replays import ReplayBatch
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """
+    Persistent queue of replays waiting for their log to be fetched.
+
+    Replays found by the sources are appended in batches and stay on disk
+    until their log is stored, so a restart resumes where it stopped:
+    - `take` hands out a batch and hides it for `lease` seconds, if the
+      worker dies meanwhile the batch becomes available again.
+    - `done` removes the stored replays.
+    - `retry` keeps failed replays with their attempt count and the time of
+      the next attempt (exponential backoff), up to `max_attempts`.
+    """
+
+    def __init__(
+        self,
+        name: str = "crawl.db",
+        lease: float = 600,
+        backoff: float = 60,
+        max_attempts: int = consts.RETRIES,
+    ) -> None:
+        self.name = name
+        self.lease = lease
+        self.backoff = backoff
+        self.max_attempts = max_attempts
+        self.create_table()
+
+    def connect(self):
+        return sqlite3.connect(self.name, timeout=30)
+
+    def create_table(self):
+        """Initialize queue table."""
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending (
+                id TEXT PRIMARY KEY,
+                format TEXT,
+                rating INTEGER,
+                attempts INTEGER DEFAULT 0,
+                next_attempt REAL DEFAULT 0
+            )
+        """
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS pending_next_attempt ON pending (next_attempt)")
+        conn.commit()
+        conn.close()
+
+    def push(self, replays: ReplayBatch):
+        """Append replays to the queue, ids already queued are ignored."""
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR IGNORE INTO pending (id, format, rating) VALUES (?, ?, ?)",
+            replays,
+        )
+        conn.commit()
+        logger.debug(f"Queued {cursor.rowcount} new replays")
+        conn.close()
+
+    def take(self, n: int = 50) -> ReplayBatch:
+        """Return up to n replays due for a fetch, hiding them for `lease` seconds."""
+
+        now = time.time()
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE pending SET next_attempt = ?
+            WHERE id IN (
+                SELECT id FROM pending
+                WHERE next_attempt <= ? AND attempts < ?
+                ORDER BY next_attempt
+                LIMIT ?
+            )
+            RETURNING id, format, rating
+        """,
+            (now + self.lease, now, self.max_attempts, n),
+        )
+        batch = ReplayBatch(cursor)
+        conn.commit()
+        conn.close()
+        return batch
+
+    def done(self, ids: list):
+        """Remove replays whose log has been stored."""
+
+        conn = self.connect()
+        conn.executemany("DELETE FROM pending WHERE id = ?", ((id,) for id in ids))
+        conn.commit()
+        conn.close()
+
+    def retry(self, ids: list):
+        """Count a failed attempt for each replay and schedule the next one."""
+
+        conn = self.connect()
+        conn.executemany(
+            """
+            UPDATE pending SET
+                attempts = attempts + 1,
+                next_attempt = ? + ? * (1 << attempts)
+            WHERE id = ?
+        """,
+            ((time.time(), self.backoff, id) for id in ids),
+        )
+        conn.commit()
+        conn.close()
+
+    def stats(self) -> dict:
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*), SUM(attempts > 0 AND attempts < ?), SUM(attempts >= ?) FROM pending",
+            (self.max_attempts, self.max_attempts),
+        )
+        pending, retrying, failed = cursor.fetchone()
+        conn.close()
+        return {"pending": pending, "retrying": retrying or 0, "failed": failed or 0}
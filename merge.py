@@ -0,0 +1,176 @@
+import os
+import time
+import tyro
+import logging
+
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from db import DB
+from logger import setup
+from players import PlayerIndex
+from search import SearchIndex
+
+
+logger = logging.getLogger(__name__)
+
+LOG_COLUMNS = ["id", "format", "rating", "log"]
+PLAYER_COLUMNS = ["id", "format", "name", "rating", "last_seen", "last_crawled", "newest_upload", "crawls", "found"]
+
+
+def columns(conn, schema: str, table: str) -> list:
+    """Return the column names of a table, empty if the table does not exist."""
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def select_list(available: list, wanted: list) -> str:
+    """Select the wanted columns, NULL for the ones missing in older schemas."""
+    return ", ".join(c if c in available else f"NULL AS {c}" for c in wanted)
+
+
+@contextmanager
+def deferred_indexes(target: DB):
+    """
+    Drop the secondary indexes of logs, rebuild them on exit, even if a
+    merge fails, faster when merging large shards.
+    """
+    conn = target.connect()
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'logs' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.commit()
+    logger.info(f"Deferred indexes {[name for name, _ in indexes]}")
+    try:
+        yield
+    finally:
+        for name, sql in indexes:
+            logger.info(f"Rebuilding index {name}")
+            conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+
+def merge(target: DB, source: str, batch: int = 100000) -> int:
+    """
+    Merge the logs, players and search index of the `source` database into `target`.
+    Logs are copied with set-based INSERT OR IGNORE, `batch` source rows per
+    transaction, so ids already present in target are kept as they are.
+    Merging the same source twice changes nothing.
+    Returns the number of logs added.
+    """
+    if not os.path.exists(source):
+        # ATTACH would create an empty database
+        raise FileNotFoundError(f"{source} does not exist")
+
+    index = PlayerIndex(target)
+    conn = target.connect()
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+    conn.execute("ATTACH DATABASE ? AS src", (source,))
+
+    log_columns = columns(conn, "src", "logs")
+    if "id" not in log_columns:
+        logger.warning(f"{source} has no logs table, skipping")
+        conn.execute("DETACH DATABASE src")
+        conn.close()
+        return 0
+
+    low, high = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM src.logs").fetchone()
+    before = target_count = conn.execute("SELECT COUNT(*) FROM main.logs").fetchone()[0]
+    start = time.time()
+    if low is not None:
+        query = (
+            f"INSERT OR IGNORE INTO main.logs ({', '.join(LOG_COLUMNS)}) "
+            f"SELECT {select_list(log_columns, LOG_COLUMNS)} FROM src.logs WHERE rowid >= ? AND rowid < ?"
+        )
+        for first in range(low, high + 1, batch):
+            conn.execute(query, (first, first + batch))
+            conn.commit()
+            done = min(first + batch, high + 1) - low
+            logger.info(
+                f"{source}: {100 * done / (high + 1 - low):5.1f}% of rowids, "
+                f"{done / max(time.time() - start, 1e-9):8.0f} rows/s"
+            )
+        target_count = conn.execute("SELECT COUNT(*) FROM main.logs").fetchone()[0]
+
+    # keep the player index consistent with the merged logs,
+    # MAX rather than sum of the counters so merging again is a no-op
+    player_columns = columns(conn, "src", "players")
+    if player_columns:
+        conn.execute(
+            f"""
+            INSERT INTO main.players ({', '.join(PLAYER_COLUMNS)})
+            SELECT {select_list(player_columns, PLAYER_COLUMNS)} FROM src.players WHERE true
+            ON CONFLICT (id, format) DO UPDATE SET
+                rating = CASE WHEN excluded.rating > COALESCE(rating, -1) THEN excluded.rating ELSE rating END,
+                last_seen = MAX(COALESCE(last_seen, 0), COALESCE(excluded.last_seen, 0)),
+                last_crawled = MAX(COALESCE(last_crawled, 0), COALESCE(excluded.last_crawled, 0)),
+                newest_upload = MAX(COALESCE(newest_upload, 0), COALESCE(excluded.newest_upload, 0)),
+                crawls = MAX(COALESCE(crawls, 0), COALESCE(excluded.crawls, 0)),
+                found = MAX(COALESCE(found, 0), COALESCE(excluded.found, 0))
+        """
+        )
+        conn.commit()
+    elif "log" in log_columns:
+        logger.info(f"{source} has no players table, indexing players of its logs")
+        cursor = conn.execute(f"SELECT {select_list(log_columns, ['format', 'log'])} FROM src.logs WHERE log IS NOT NULL")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            index.seen_logs(rows, conn=conn)
+        conn.commit()
+
+    # and the search index, if the target has one
+    if columns(conn, "main", "terms"):
+        if columns(conn, "src", "terms"):
+            conn.execute("INSERT OR IGNORE INTO main.terms (kind, term, id) SELECT kind, term, id FROM src.terms")
+        elif "log" in log_columns:
+            logger.info(f"{source} has no search index, indexing its logs")
+            search = SearchIndex(target)
+            cursor = conn.execute("SELECT id, log FROM src.logs WHERE log IS NOT NULL")
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                search.add(rows, conn)
+        conn.commit()
+
+    conn.execute("DETACH DATABASE src")
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+    added = target_count - before
+    logger.info(f"Merged {source}: {added} new logs in {time.time() - start:.0f}s")
+    return added
+
+
+if __name__ == "__main__":
+
+    @dataclass
+    class Args:
+        sources: tuple[str, ...]
+        """Databases to merge into target"""
+
+        target: str = "logs.db"
+        """Database receiving the logs"""
+
+        batch: int = 100000
+        """Source rows copied per transaction"""
+
+        defer_indexes: bool = False
+        """Drop secondary indexes while copying and rebuild them after the last source"""
+
+    args = tyro.cli(Args)
+    setup()
+
+    missing = [source for source in args.sources if not os.path.exists(source)]
+    if missing:
+        raise SystemExit(f"Missing sources: {', '.join(missing)}")
+
+    target = DB(args.target)
+    with deferred_indexes(target) if args.defer_indexes else nullcontext():
+        for source in args.sources:
+            merge(target, source, batch=args.batch)
+    target.stats()
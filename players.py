@@ -0,0 +1,227 @@
+import time
+import tyro
+import consts
+import logging
+
+from dataclasses import dataclass
+from consts import to_id
+from db import DB
+from logger import setup
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_players(log: str) -> tuple:
+    """
+    Parse the `|player|` lines of a battle log, returning the battle time
+    (None if missing) and a list of (name, rating), rating is None if missing.
+    e.g., '|player|p1|Some Player|60|1623' -> ('Some Player', 1623)
+    """
+    timestamp = None
+    players = []
+    for line in log.splitlines():
+        if line.startswith("|player|"):
+            parts = line.split("|")
+            if len(parts) < 4 or not parts[3]:
+                continue
+            rating = parts[5] if len(parts) > 5 else ""
+            players.append((parts[3], int(rating) if rating.isdigit() else None))
+        elif timestamp is None and line.startswith("|t:|"):
+            timestamp = float(line[4:]) if line[4:].isdigit() else None
+        elif line.startswith("|start"):
+            break  # players are announced before the battle starts
+    return timestamp, players
+
+
+class PlayerIndex:
+    """
+    Players seen by the sources and in the stored logs, with their peak
+    rating per format, when they were last seen and last crawled, and how
+    many new replays their crawls yielded. Used to search the most valuable
+    players first instead of every player a source finds.
+    """
+
+    def __init__(self, db: DB, top: int = 100, stale: float = 6 * 3600) -> None:
+        self.db = db
+        self.top_k = top  # players searched per format by `select`
+        self.stale = stale  # seconds before a crawled player is searched again
+        self.create_table()
+
+    def create_table(self):
+        """Initialize players table."""
+
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS players (
+                id TEXT,
+                format TEXT,
+                name TEXT,
+                rating INTEGER,
+                last_seen REAL,
+                last_crawled REAL,
+                newest_upload REAL DEFAULT 0,
+                crawls INTEGER DEFAULT 0,
+                found INTEGER DEFAULT 0,
+                PRIMARY KEY (id, format)
+            )
+        """
+        )
+        conn.commit()
+        conn.close()
+
+    def seen(self, rows, conn=None):
+        """
+        Record (name, format, rating, timestamp) rows, keeping the peak rating
+        and the latest timestamp. rating and timestamp may be None.
+        """
+        own = conn is None
+        conn = conn or self.db.connect()
+        now = time.time()
+        conn.executemany(
+            """
+            INSERT INTO players (id, format, name, rating, last_seen) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (id, format) DO UPDATE SET
+                name = excluded.name,
+                rating = CASE WHEN excluded.rating > COALESCE(rating, -1) THEN excluded.rating ELSE rating END,
+                last_seen = MAX(last_seen, excluded.last_seen)
+        """,
+            (
+                (to_id(name), format, name, rating, timestamp or now)
+                for name, format, rating, timestamp in rows
+                if to_id(name)
+            ),
+        )
+        if own:
+            conn.commit()
+            conn.close()
+
+    def seen_logs(self, rows, conn=None):
+        """Record the players of (format, log) rows."""
+        self.seen(
+            (
+                (name, format, rating, timestamp)
+                for format, log in rows
+                for timestamp, players in [parse_players(log)]
+                for name, rating in players
+            ),
+            conn=conn,
+        )
+
+    def crawled(self, name: str, format: str, uploads: list):
+        """
+        Record a search of the player replays, `uploads` are the upload times
+        of the replays found, the ones newer than the previous crawl count as found.
+        """
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        id = to_id(name)
+        cursor.execute("SELECT newest_upload FROM players WHERE id = ? AND format = ?", (id, format))
+        row = cursor.fetchone()
+        newest = row[0] if row else 0
+        found = sum(upload > newest for upload in uploads)
+        cursor.execute(
+            """
+            INSERT INTO players (id, format, name, last_seen, last_crawled, newest_upload, crawls, found)
+            VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (id, format) DO UPDATE SET
+                last_crawled = excluded.last_crawled,
+                newest_upload = MAX(newest_upload, excluded.newest_upload),
+                crawls = crawls + 1,
+                found = found + excluded.found
+        """,
+            (id, format, name, time.time(), time.time(), max(uploads, default=newest), found),
+        )
+        conn.commit()
+        conn.close()
+
+    def select(self, names: list, format: str) -> list:
+        """
+        Return up to `top` of the given players worth searching for `format`:
+        only players not crawled in the last `stale` seconds, highest score first.
+        The score is the peak rating (1000 if unknown) times the new replays per
+        crawl, which starts optimistic at 1 for players never crawled.
+        """
+        ids = {to_id(name): name for name in names}
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        known = {}
+        keys = list(ids)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            cursor.execute(
+                "SELECT id, rating, last_crawled, crawls, found FROM players WHERE format = ? AND id IN ({})".format(
+                    ",".join("?" * len(chunk))
+                ),
+                [format] + chunk,
+            )
+            known.update((row[0], row[1:]) for row in cursor.fetchall())
+        conn.close()
+
+        now = time.time()
+        scores = []
+        for id, name in ids.items():
+            rating, last_crawled, crawls, found = known.get(id, (None, None, 0, 0))
+            if last_crawled is not None and now - last_crawled < self.stale:
+                continue
+            scores.append(((rating or 1000) * (found + 1) / (crawls + 1), name))
+        scores.sort(reverse=True)
+        selected = [name for _, name in scores[:self.top_k]]
+        logger.info(f"Selected {len(selected)} of {len(ids)} players for {format}")
+        return selected
+
+    def rebuild(self, batch: int = 10000):
+        """Record the players of every stored log."""
+
+        read = self.db.connect()
+        write = self.db.connect()
+        cursor = read.cursor()
+        cursor.execute("SELECT format, log FROM logs WHERE log IS NOT NULL")
+        count = 0
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            self.seen_logs(rows, conn=write)
+            write.commit()
+            count += len(rows)
+            logger.info(f"Indexed players of {count} logs")
+        read.close()
+        write.close()
+
+    def top(self, format: str, k: int = 20) -> list:
+        conn = self.db.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT name, rating, last_seen, last_crawled, crawls, found FROM players "
+            "WHERE format = ? AND rating IS NOT NULL ORDER BY rating DESC LIMIT ?",
+            (format, k),
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+
+if __name__ == "__main__":
+
+    @dataclass
+    class Args:
+        rebuild: bool = False
+        """Index the players of every stored log"""
+
+        top: int = 10
+        """Number of top rated players to show per format"""
+
+    args = tyro.cli(Args)
+    setup()
+
+    index = PlayerIndex(DB())
+    if args.rebuild:
+        index.rebuild()
+
+    for format in consts.FORMATS:
+        logger.info(f"Top players for {format}")
+        for name, rating, _, _, crawls, found in index.top(format, args.top):
+            logger.info(f"| {name:<25} | {rating:>5} | crawls {crawls:>4} | found {found:>5} |")
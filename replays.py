@@ -0,0 +1,94 @@
+from array import array
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class Replay:
+    id: str
+    format: str
+    rating: int
+
+
+NO_RATING = -1  # stored in place of a missing (None) rating
+
+
+class ReplayBatch:
+    """
+    Columnar batch of replays, used instead of lists of Replay to keep
+    hundreds of thousands of queued replays in a few flat buffers:
+    - ids are concatenated in a single bytes buffer, with their end offsets.
+    - formats are interned, each replay stores the index of its format.
+    - ratings are int32, NO_RATING for unrated battles.
+    Iterating yields (id, format, rating) tuples, ready for executemany.
+    """
+
+    __slots__ = ("id_buffer", "id_offsets", "formats", "format_codes", "format_index", "ratings")
+
+    def __init__(self, rows=()) -> None:
+        self.id_buffer = bytearray()
+        self.id_offsets = array("I")
+        self.formats = []
+        self.format_index = {}
+        self.format_codes = array("H")
+        self.ratings = array("i")
+        for id, format, rating in rows:
+            self.append(id, format, rating)
+
+    @classmethod
+    def from_search(cls, data: list) -> "ReplayBatch":
+        """Build a batch from the entries of a search.json page."""
+        return cls((d["id"], d["format"], d["rating"]) for d in data)
+
+    def append(self, id: str, format: str, rating: int):
+        code = self.format_index.get(format)
+        if code is None:
+            code = self.format_index[format] = len(self.formats)
+            self.formats.append(format)
+        self.id_buffer += id.encode()
+        self.id_offsets.append(len(self.id_buffer))
+        self.format_codes.append(code)
+        self.ratings.append(NO_RATING if rating is None else rating)
+
+    def extend(self, other: "ReplayBatch"):
+        if not isinstance(other, ReplayBatch):
+            for id, format, rating in other:
+                self.append(id, format, rating)
+            return
+        base = len(self.id_buffer)
+        self.id_buffer += other.id_buffer
+        self.id_offsets.extend(base + offset for offset in other.id_offsets)
+        remap = []
+        for format in other.formats:
+            code = self.format_index.get(format)
+            if code is None:
+                code = self.format_index[format] = len(self.formats)
+                self.formats.append(format)
+            remap.append(code)
+        self.format_codes.extend(remap[code] for code in other.format_codes)
+        self.ratings.extend(other.ratings)
+
+    def id(self, i: int) -> str:
+        start = self.id_offsets[i - 1] if i else 0
+        return self.id_buffer[start:self.id_offsets[i]].decode()
+
+    def ids(self) -> list:
+        return [self.id(i) for i in range(len(self))]
+
+    def __len__(self) -> int:
+        return len(self.id_offsets)
+
+    def __getitem__(self, i: int) -> Replay:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("replay index out of range")
+        rating = self.ratings[i]
+        return Replay(self.id(i), self.formats[self.format_codes[i]], None if rating == NO_RATING else rating)
+
+    def __iter__(self):
+        start = 0
+        buffer = self.id_buffer
+        formats = self.formats
+        for end, code, rating in zip(self.id_offsets, self.format_codes, self.ratings):
+            yield buffer[start:end].decode(), formats[code], None if rating == NO_RATING else rating
+            start = end
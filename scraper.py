@@ -8,8 +8,9 @@ import requests
 import functools
 import subprocess
 
-from dataclasses import dataclass
 from consts import to_compact_notation
+from governor import governor
+from replays import Replay, ReplayBatch
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
@@ -17,15 +18,13 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import StaleElementReferenceException
 
-@dataclass(init=True)
-class Replay:
-    id: str
-    format: str
-    rating: int
-
 logger = logging.getLogger(__name__)
 
 URL = "https://replay.pokemonshowdown.com"
+LADDER_URL = "https://pokemonshowdown.com"
+
+# response cache of search and ladder pages, see cache.ResponseCache
+cache = None
 
 
 def handle_request_exceptions(func):
@@ -49,157 +48,207 @@ def handle_request_exceptions(func):
     return wrapper
 
 
+def get(url: str):
+    """
+    Send a GET paced by the rate governor, answered from the response
+    cache when set and the page is unchanged.
+    """
+    if cache is None:
+        return governor.get(url)
+    return cache.get(url, fetch=governor.get)
+
+
 @handle_request_exceptions
-def scrape_log(id: str, wait: float = .05):
+def scrape_log(id: str):
     """
     Retrieve the text log realted to battle id passed as argument.
-    When used in a loop, might be necessary waiting some time.
+    Requests are paced by the governor, no need to wait between them.
     - id: battle id, a string of this form <format>-<battle-id>
-    - wait: time between sequential requests
     """
     logger.debug(f"Requesting log id ({id}) json")
-    response = requests.get(f"{URL}/{id}.log")
+    response = governor.get(f"{URL}/{id}.log")
     response.raise_for_status()  # raises errors
     logger.debug(f"Succesfully retrieved log id {id} json")
-    time.sleep(wait)
     return response.text  # return the log
 
 
+def claimed(items, key, claim=None):
+    """
+    Filter work items through a `claim` function, e.g. coord.Leases.claim,
+    so that concurrent workers split the items. Without claim every item is kept.
+    - items: iterable of work items
+    - key: function mapping an item to a unique key of the request it causes
+    """
+    return items if claim is None else claim(items, key)
+
+
+def collect(replays: ReplayBatch, data: list, push=None, index=None):
+    """
+    Append the replays of a search.json page to `replays`, and hand them to
+    `push` (e.g. ingest.IngestQueue.push) so they are persisted right away.
+    The players of each replay are recorded in the index (players.PlayerIndex)
+    if given, without rating since the page only has the battle rating.
+    """
+    page = ReplayBatch.from_search(data)
+    replays.extend(page)
+    if push is not None:
+        push(page)
+    if index is not None:
+        index.seen((p, d["format"], None, d.get("uploadtime")) for d in data for p in d.get("players", []))
+
+
+def select(players: list, format: str, index=None) -> list:
+    """
+    Keep the players worth searching for `format` according to the index
+    (players.PlayerIndex), recording them as seen. Without index every player is kept.
+    """
+    if index is None:
+        return players
+    index.seen((player, format, None, None) for player in players)
+    return index.select(players, format)
+
+
+def user_key(item):
+    player, format = item
+    return f"user:{player}:{format}"
+
+
 # --------------------------------------------------
 # Scraping Sources
 # --------------------------------------------------
 @handle_request_exceptions
-def scrape_recents():
+def scrape_recents(claim=None, push=None, index=None):
     """
-    Scrape recently played data and return a list of replay.
+    Scrape recently played data and return a batch of replays.
     Each replay contains an id (in form of <format>-<battle-id>)
     the format of the battle and the rating.
     """
-    replays = []
+    replays = ReplayBatch()
+    # the lease is finished once the loop resumes, i.e. after a successful request
+    for _ in claimed(["recents"], str, claim):
+        logger.debug("Requesting replay json")
+        response = get(f"{URL}/search.json?")
+        response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
+        logger.debug("Succesfully retrieved json, scraping each log")
+
+        data = response.json()
+        collect(replays, data, push, index)
+    return replays
 
-    logger.debug("Requesting replay json")
-    response = requests.get(f"{URL}/search.json?")
-    response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
-    logger.debug("Succesfully retrieved json, scraping each log")
 
-    data = response.json()
-    for d in data:
-        replays.append(Replay(d["id"], d["format"], d["rating"]))
+def scrape_users(items, claim=None, push=None, index=None):
+    """
+    Search replays of each (player, format) pair in items.
+    Searches are recorded in the index (players.PlayerIndex) if given.
+    """
+    replays = ReplayBatch()
+    for player, format in claimed(items, user_key, claim):
+        logger.debug(f"Requesting replays with player {player} format {format}")
+        url = f"{URL}/search.json?user={player}&format={format}"
+        response = get(url)
+        response.raise_for_status()
+
+        data = response.json()
+
+        collect(replays, data, push, index)
+        # a response served from the cache is not a new search of the player
+        if index is not None and not getattr(response, "from_cache", False):
+            index.crawled(player, format, [d.get("uploadtime", 0) for d in data])
+
     return replays
 
 
 @handle_request_exceptions
-def scrape_formats():
-    for format in consts.FORMATS:
-        replays = []
-        logger.debug(f"Requesting replays with format {format}")
-        for page in range(1, 101):
-            logger.debug(f"Requesting replays for page {page} with format {format}")
-            url = f"{URL}/search.json?format={format}&page={page}"
-            logger.debug(f"Sending request")
-            response = requests.get(url)
-            response.raise_for_status()
-            logger.debug("Succesfully retrieved json")
+def scrape_formats(claim=None, push=None, index=None):
+    replays = ReplayBatch()
+    pages = [(format, page) for format in consts.FORMATS for page in range(1, 101)]
+    for format, page in claimed(pages, lambda p: f"search:{p[0]}:{p[1]}", claim):
+        logger.debug(f"Requesting replays for page {page} with format {format}")
+        url = f"{URL}/search.json?format={format}&page={page}"
+        logger.debug(f"Sending request")
+        response = get(url)
+        response.raise_for_status()
+        logger.debug("Succesfully retrieved json")
 
-            data = response.json()
+        data = response.json()
 
-            for d in data:
-                replays.append(Replay(d["id"], d["format"], d["rating"]))
+        collect(replays, data, push, index)
 
-        logger.info(f"Found {len(replays)} replays with format {format}")
+    logger.info(f"Found {len(replays)} replays from formats")
 
     return replays
 
 
 @handle_request_exceptions
-def scrape_ladders():
+def scrape_ladders(claim=None, push=None, index=None):
+    replays = ReplayBatch()
     for format in consts.FORMATS:
-        replays = []
         compact_format = to_compact_notation(format)
         logger.info(f"Requesting player data for format {compact_format}")
-        players = scrape_ladders_usernames(compact_format)
-        for player in players:
-            logger.debug(f"Requesting replays with player {player} format {format}")
-            url = f"{URL}/search.json?user={player}&format={format}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            data = response.json()
-
-            for d in data:
-                replays.append(Replay(d["id"], d["format"], d["rating"]))
-
-        logger.info(f"Found {len(replays)} replays with format {format} from ladders")
+        ratings = scrape_ladders_ratings(compact_format) or []
+        if index is not None:
+            index.seen((player, format, rating, None) for player, rating in ratings)
+        players = select([player for player, _ in ratings], format, index)
+        new_replays = scrape_users([(player, format) for player in players], claim, push, index)
+        replays.extend(new_replays)
+        logger.info(f"Found {len(new_replays)} replays with format {format} from ladders")
 
     return replays
 
 
 @handle_request_exceptions
-def scrape_members():
+def scrape_members(claim=None, push=None, index=None):
     players = scrape_members_usernames()
-    replays = []
+    replays = ReplayBatch()
 
     for format in consts.FORMATS:
-        for player in players:
-            logger.debug(f"Requesting replays with player {player} format {format}")
-            url = f"{URL}/search.json?user={player}&format={format}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            data = response.json()
-
-            for d in data:
-                replays.append(Replay(d["id"], d["format"], d["rating"]))
-
-        logger.info(f"Found {len(replays)} replays with format {format} from members")
+        selected = select(players, format, index)
+        new_replays = scrape_users([(player, format) for player in selected], claim, push, index)
+        replays.extend(new_replays)
+        logger.info(f"Found {len(new_replays)} replays with format {format} from members")
 
     return replays
 
 
-def scrape_roomlst():
-    players = []
-    replays = []
+@handle_request_exceptions
+def scrape_roomlst(claim=None, push=None, index=None):
+    replays = ReplayBatch()
     room = random.choice(consts.ROOMLIST)
     logger.info(f"Requesting usernames for room {room}")
-    new_players = scrape_roomlist_usernames(room)
-    players.extend(new_players)
+    players = scrape_roomlist_usernames(room)
 
     for format in consts.FORMATS:
-        for player in players:
-            logger.debug(f"Requesting replays with player {player} format {format}")
-            url = f"{URL}/search.json?user={player}&format={format}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            data = response.json()
-
-            for d in data:
-                replays.append(Replay(d["id"], d["format"], d["rating"]))
-
-        logger.info(f"Found {len(replays)} replays with format {format} from {room}")
+        selected = select(players, format, index)
+        new_replays = scrape_users([(player, format) for player in selected], claim, push, index)
+        replays.extend(new_replays)
+        logger.info(f"Found {len(new_replays)} replays with format {format} from {room}")
 
     return replays
 
 
-
-
-
 # --------------------------------------------------
 # Username Scrapers
 # --------------------------------------------------
 @handle_request_exceptions
-def scrape_ladders_usernames(format: str):
-
+def scrape_ladders_ratings(format: str):
+    """
+    Return the (username, rating) of the ladder top players.
+    - format: compact notation of the format, e.g. gen9ou
+    """
     logger.info(f"Scraping ladder for {format} format")
-    url = f'https://pokemonshowdown.com/ladder/{format}.json'
+    url = f'{LADDER_URL}/ladder/{format}.json'
 
-    response = requests.get(url)
+    response = get(url)
     response.raise_for_status()
 
     data = response.json()
-    usernames = [entry['username'] for entry in data['toplist']]
-    logger.info(f"Found {len(usernames)} for {format} format")
-    return usernames
+    ratings = [(entry['username'], int(entry['elo'])) for entry in data['toplist']]
+    logger.info(f"Found {len(ratings)} for {format} format")
+    return ratings
+
+
+def scrape_ladders_usernames(format: str):
+    return [username for username, _ in scrape_ladders_ratings(format) or []]
 
 
 def scrape_members_usernames():
@@ -0,0 +1,161 @@
+import time
+import tyro
+import logging
+
+from dataclasses import dataclass
+from consts import to_id
+from logger import setup
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_terms(log: str) -> set:
+    """
+    Parse the (kind, term) pairs of a battle log, terms are showdown ids:
+    - player from '|player|p1|Some Player|...'
+    - species from '|poke|p1|Garchomp, M|' and '|switch|p1a: Nick|Garchomp, L82, F|100/100'
+    - move from '|move|p1a: Nick|Swords Dance|p1a: Nick'
+    """
+    terms = set()
+    for line in log.splitlines():
+        parts = line.split("|", 4)
+        if len(parts) < 4:
+            continue
+        kind = parts[1]
+        if kind == "player":
+            term, kind = parts[3], "player"
+        elif kind in ("poke", "switch", "drag", "detailschange", "replace"):
+            term, kind = parts[3].split(",")[0], "species"
+        elif kind == "move":
+            term = parts[3]
+        else:
+            continue
+        term = to_id(term)
+        if term:
+            terms.add((kind, term))
+    return terms
+
+
+class SearchIndex:
+    """
+    Inverted index of the players, species and moves of each stored log,
+    kept in the terms table of the logs database. Optional: created with
+    DB(index=True) or, for an existing database, `python3 search.py --rebuild`.
+    Once the table exists, DB indexes the logs as they are added.
+    """
+
+    def __init__(self, db) -> None:
+        self.db = db
+        self.create_table()
+
+    def create_table(self):
+        """Initialize terms table."""
+
+        conn = self.db.connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS terms (
+                kind TEXT,
+                term TEXT,
+                id TEXT,
+                PRIMARY KEY (kind, term, id)
+            ) WITHOUT ROWID
+        """
+        )
+        conn.commit()
+        conn.close()
+
+    def add(self, rows, conn):
+        """Index (id, log) rows, within the transaction of conn."""
+        conn.executemany(
+            "INSERT OR IGNORE INTO terms (kind, term, id) VALUES (?, ?, ?)",
+            ((kind, term, id) for id, log in rows if log for kind, term in parse_terms(log)),
+        )
+
+    def rebuild(self, batch: int = 10000):
+        """Drop the index and index every stored log."""
+
+        read = self.db.connect()
+        write = self.db.connect()
+        write.execute("DELETE FROM terms")
+        cursor = read.cursor()
+        cursor.execute("SELECT id, log FROM logs WHERE log IS NOT NULL")
+        count = 0
+        start = time.time()
+        while True:
+            rows = cursor.fetchmany(batch)
+            if not rows:
+                break
+            self.add(rows, write)
+            write.commit()
+            count += len(rows)
+            logger.info(f"Indexed {count} logs ({count / (time.time() - start):.0f} logs/s)")
+        write.commit()
+        read.close()
+        write.close()
+
+    def search(self, players=(), species=(), moves=(), **filters) -> list:
+        """
+        Return the (id, format, rating) of the logs containing every given
+        player, species and move, e.g. search(species=["Garchomp"], moves=["Swords Dance"]).
+        Other keyword arguments (format, rating_min, rating_max, after, limit) filter as in DB.filter.
+        """
+        terms = (
+            [("player", to_id(p)) for p in players]
+            + [("species", to_id(s)) for s in species]
+            + [("move", to_id(m)) for m in moves]
+        )
+        return self.db.filter(terms=terms, **filters)
+
+
+if __name__ == "__main__":
+    from db import DB  # db imports this module
+
+    @dataclass
+    class Args:
+        rebuild: bool = False
+        """Index every stored log"""
+
+        player: tuple[str, ...] = ()
+        """Players that took part in the battle"""
+
+        species: tuple[str, ...] = ()
+        """Pokemon that appeared in the battle"""
+
+        move: tuple[str, ...] = ()
+        """Moves used in the battle"""
+
+        format: str | None = None
+        """Battle format, e.g. '[Gen 9] OU'"""
+
+        rating_min: int | None = None
+        """Minimum rating (inclusive)"""
+
+        rating_max: int | None = None
+        """Maximum rating (inclusive)"""
+
+        limit: int = 100
+        """Max number of ids returned"""
+
+    args = tyro.cli(Args)
+    setup()
+
+    index = SearchIndex(DB())
+    if args.rebuild:
+        index.rebuild()
+
+    if args.player or args.species or args.move:
+        start = time.time()
+        rows = index.search(
+            args.player,
+            args.species,
+            args.move,
+            format=args.format,
+            rating_min=args.rating_min,
+            rating_max=args.rating_max,
+            limit=args.limit,
+        )
+        for id, format, rating in rows:
+            print(id, format, rating)
+        logger.info(f"Found {len(rows)} logs in {1000 * (time.time() - start):.1f} ms")
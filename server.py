@@ -0,0 +1,313 @@
+import json
+import queue
+import tyro
+import logging
+import itertools
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from consts import to_id
+from db import DB
+from logger import setup
+
+
+logger = logging.getLogger(__name__)
+
+
+# --------------------------------------------------
+# Connection pool and cache
+# --------------------------------------------------
+class ConnectionPool:
+    """Fixed-size pool of read-only connections shared by the handler threads."""
+
+    def __init__(self, db: DB, size: int = 8) -> None:
+        self.pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self.pool.put(db.connect(readonly=True, check_same_thread=False))
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put(conn)
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by the total size (in bytes) of its values.
+    Values are the already encoded json of a log, so hot logs are neither
+    read from disk nor serialized again.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.items[key] = value
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.items.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "items": len(self.items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def encode_log(row) -> bytes:
+    id, format, rating, log = row
+    return json.dumps({"id": id, "format": format, "rating": rating, "log": log}).encode()
+
+
+# --------------------------------------------------
+# Request handler
+# --------------------------------------------------
+class Handler(BaseHTTPRequestHandler):
+    """
+    Routes:
+    - GET /logs/<id>                       a single log
+    - GET /logs?id=<id>&id=<id>...         a batch of logs (missing ids are skipped), cached
+                                           ones first, then the others in storage order
+    - GET /search?format=&rating_min=&rating_max=&after=&limit=
+                                           a page of (id, format, rating), ordered by id,
+                                           pass the returned `next` as `after` for the next page
+      &player=&species=&move=              (repeatable) logs containing all of them,
+                                           needs the search index (search.py), 400 without it
+    - GET /stats                           cache statistics
+    """
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, avoid the delayed ack stall on keep-alive
+    disable_nagle_algorithm = True
+    server: "LogServer"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.streaming = False
+        try:
+            if url.path.startswith("/logs/"):
+                self.get_log(unquote(url.path[len("/logs/"):]))
+            elif url.path == "/logs":
+                self.get_logs(params.get("id", []))
+            elif url.path == "/search":
+                self.search(params)
+            elif url.path == "/stats":
+                self.send_json(json.dumps(self.server.cache.stats()).encode())
+            else:
+                self.send_error(404, "Unknown route")
+        except ValueError as e:
+            self.send_error(400, str(e))
+        except Exception:
+            logger.exception(f"Failed to serve {self.path}")
+            if self.streaming:
+                # the status is already sent, a truncated body is all we can report
+                self.close_connection = True
+            else:
+                self.send_error(500)
+
+    # ---------- routes ----------
+    def get_log(self, id: str):
+        body = self.server.cache.get(id)
+        if body is None:
+            with self.server.pool.connection() as conn:
+                row = self.server.db.get(id, conn=conn)
+            if row is None:
+                self.send_error(404, f"Log {id} not found")
+                return
+            body = encode_log(row)
+            self.server.cache.put(id, body)
+        self.send_json(body)
+
+    def get_logs(self, ids: list):
+        """Cached logs come first, in request order, then the others as they are read."""
+        if len(ids) > self.server.max_batch:
+            raise ValueError(f"At most {self.server.max_batch} ids per batch")
+
+        cached = []
+        missing = {}
+        for id in ids:
+            body = self.server.cache.get(id)
+            if body is None:
+                missing[id] = None
+            else:
+                cached.append(body)
+
+        def read(conn):
+            for row in self.server.db.iter_many(list(missing), conn=conn):
+                body = encode_log(row)
+                self.server.cache.put(row[0], body)
+                yield body
+
+        if not missing:
+            self.send_stream(b"[", cached, b"]")
+            return
+        with self.server.pool.connection() as conn:
+            self.send_stream(b"[", itertools.chain(cached, read(conn)), b"]")
+
+    def search(self, params: dict):
+        def param(name, cast=str):
+            return cast(params[name][0]) if name in params else None
+
+        limit = param("limit", int)
+        if limit is None:
+            limit = 100
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        limit = min(limit, self.server.max_page)
+        terms = [(kind, to_id(term)) for kind in ("player", "species", "move") for term in params.get(kind, [])]
+        if terms and self.server.db.index is None:
+            raise ValueError("Searching players, species or moves needs the search index, build it with search.py --rebuild")
+        filters = dict(
+            format=param("format"),
+            rating_min=param("rating_min", int),
+            rating_max=param("rating_max", int),
+            after=param("after") or "",
+            limit=limit,
+            terms=terms,
+        )
+
+        last = []  # (count, id) of the last row sent, for the next page cursor
+
+        def read(conn):
+            for count, (id, format, rating) in enumerate(self.server.db.iter_filter(**filters, conn=conn), 1):
+                last[:] = [count, id]
+                yield json.dumps({"id": id, "format": format, "rating": rating}).encode()
+
+        def tail():
+            next = last[1] if last and last[0] == limit else None
+            return b'],"next":' + json.dumps(next).encode() + b"}"
+
+        with self.server.pool.connection() as conn:
+            self.send_stream(b'{"results":[', read(conn), tail)
+
+    # ---------- responses ----------
+    def send_json(self, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, head: bytes, items, tail, chunk_size: int = 2**16):
+        """
+        Send `head`, the comma separated `items` and `tail` using chunked
+        transfer encoding. `items` is consumed lazily, e.g. rows encoded as
+        they are read from a cursor, and a chunk is written every `chunk_size`
+        bytes, so at most one chunk of the body is held in memory.
+        - tail: bytes, or a function returning them once every item was sent
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.streaming = True
+
+        buffer = [head]
+        size = len(head)
+        for i, item in enumerate(items):
+            if i:
+                buffer.append(b",")
+            buffer.append(item)
+            size += len(item) + 1
+            if size >= chunk_size:
+                self.write_chunk(b"".join(buffer))
+                buffer, size = [], 0
+        buffer.append(tail() if callable(tail) else tail)
+        self.write_chunk(b"".join(buffer))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data: bytes):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+class LogServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, db: DB, pool_size: int = 8, cache_bytes: int = 256 * 2**20,
+                 max_batch: int = 1000, max_page: int = 1000) -> None:
+        super().__init__(address, Handler)
+        self.db = db
+        self.pool = ConnectionPool(db, pool_size)
+        self.cache = LRUCache(cache_bytes)
+        self.max_batch = max_batch
+        self.max_page = max_page
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+
+
+if __name__ == "__main__":
+
+    @dataclass
+    class Args:
+        host: str = "127.0.0.1"
+        """Address to bind"""
+
+        port: int = 8080
+        """Port to listen on"""
+
+        db: str = "logs.db"
+        """Database to serve"""
+
+        pool: int = 8
+        """Number of read-only connections"""
+
+        cache: int = 256 * 2**20
+        """Max size of the log cache (in bytes)"""
+
+        level: int = 20
+        """Logging level. Default INFO"""
+
+    args = tyro.cli(Args)
+    setup(args.level)
+
+    server = LogServer((args.host, args.port), DB(args.db), pool_size=args.pool, cache_bytes=args.cache)
+    logger.info(f"Serving {args.db} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import subprocess
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import consts
+import scraper
+
+from coord import Leases
+from governor import governor
+
+
+FORMATS = ["[Gen 9] OU", "[Gen 9] Random Battle"]
+PLAYERS = [f"player{i}" for i in range(20)]
+
+# run by each worker process: every source against the mock server, sharing one lease table
+WORKER = """
+import sys, consts, scraper, functools
+from coord import Leases
+from governor import governor
+
+url, leases_db, worker = sys.argv[1:]
+consts.FORMATS = {formats!r}
+scraper.URL = scraper.LADDER_URL = url
+for bucket in governor.buckets.values():
+    bucket.rate = bucket.max_rate = 1000
+
+leases = Leases(leases_db, worker=worker)
+claim = functools.partial(leases.claim, cooldown=600, batch=5)
+scraper.scrape_formats(claim=claim)
+scraper.scrape_ladders(claim=claim)
+scraper.scrape_recents(claim=claim)
+"""
+
+
+class MockServer(ThreadingHTTPServer):
+    """Replay and ladder server answering with small fake pages, recording every request."""
+
+    daemon_threads = True
+
+    def __init__(self, fail: int = 0, after: int = 0) -> None:
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.requests = Counter()
+        self.fail = fail  # number of requests answered with a 500
+        self.after = after  # ...once this number of requests succeeded
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests[self.path] += 1
+            failing = self.server.after <= 0 and self.server.fail > 0
+            if failing:
+                self.server.fail -= 1
+            self.server.after -= 1
+        time.sleep(.002)  # let the workers interleave
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if failing:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if url.path.startswith("/ladder/"):
+            data = {"toplist": [{"username": p, "elo": 1500 + i} for i, p in enumerate(PLAYERS)]}
+        else:
+            format = params.get("format", [FORMATS[0]])[0]
+            id = f"{consts.to_compact_notation(format)}-{abs(hash(self.path)) % 10**9}"
+            data = [{"id": id, "format": format, "rating": 1500, "players": [], "uploadtime": 0}]
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_workers_split_requests(tmp_path):
+    server = MockServer()
+    leases_db = str(tmp_path / "crawl.db")
+    Leases(leases_db)  # create the table before the workers race on it
+
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER.format(formats=FORMATS), server.url, leases_db, f"w{i}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        for i in range(4)
+    ]
+    for worker in workers:
+        assert worker.wait(timeout=120) == 0
+    server.shutdown()
+
+    searches = {path: n for path, n in server.requests.items() if path.startswith("/search.json")}
+    ladders = {path: n for path, n in server.requests.items() if path.startswith("/ladder/")}
+    # every search request is sent by exactly one worker
+    assert all(n == 1 for n in searches.values()), [p for p, n in searches.items() if n > 1]
+    assert len(searches) == len(FORMATS) * 100 + len(FORMATS) * len(PLAYERS) + 1
+    # ladder toplists are fetched by every worker to know the players
+    assert set(ladders.values()) == {len(workers)}
+
+    conn = Leases(leases_db).connect()
+    owners, running = conn.execute("SELECT COUNT(DISTINCT worker), SUM(done = 0) FROM leases").fetchone()
+    conn.close()
+    # the work was shared and every lease was completed
+    assert owners > 1 and running == 0
+
+
+def test_failed_request_is_retried(tmp_path, monkeypatch):
+    server = MockServer(fail=1)
+    monkeypatch.setattr(scraper, "URL", server.url)
+    monkeypatch.setattr(scraper, "cache", None)
+    for bucket in governor.buckets.values():
+        monkeypatch.setattr(bucket, "rate", 1000)
+
+    first = Leases(str(tmp_path / "crawl.db"), worker="first")
+    second = Leases(str(tmp_path / "crawl.db"), worker="second")
+    assert scraper.scrape_recents(claim=functools.partial(first.claim, cooldown=600)) is None
+    # the failed request is released, not kept for the cooldown
+    assert len(scraper.scrape_recents(claim=functools.partial(second.claim, cooldown=600))) == 1
+    # the successful one is not repeated before the cooldown
+    assert len(scraper.scrape_recents(claim=functools.partial(first.claim, cooldown=600))) == 0
+    server.shutdown()
+    assert server.requests["/search.json"] == 2
+
+
+def test_failure_keeps_finished_items(tmp_path, monkeypatch):
+    # the 4th page of the first batch fails
+    server = MockServer(fail=1, after=3)
+    monkeypatch.setattr(scraper, "URL", server.url)
+    monkeypatch.setattr(scraper, "cache", None)
+    monkeypatch.setattr(consts, "FORMATS", FORMATS[:1])
+    for bucket in governor.buckets.values():
+        monkeypatch.setattr(bucket, "rate", 1000)
+
+    first = Leases(str(tmp_path / "crawl.db"), worker="first")
+    second = Leases(str(tmp_path / "crawl.db"), worker="second")
+    assert scraper.scrape_formats(claim=functools.partial(first.claim, cooldown=600, batch=10)) is None
+    # the pages fetched before the failure are not requested again, the failed one is
+    assert len(scraper.scrape_formats(claim=functools.partial(second.claim, cooldown=600, batch=10))) == 97
+    server.shutdown()
+    pages = {path: n for path, n in server.requests.items() if path.startswith("/search.json")}
+    assert len(pages) == 100
+    assert sorted(pages.values()) == [1] * 99 + [2]
+
+
+def test_dead_worker_lease_expires(tmp_path):
+    dead = Leases(str(tmp_path / "crawl.db"), worker="dead", ttl=.2)
+    alive = Leases(str(tmp_path / "crawl.db"), worker="alive", ttl=.2)
+    assert dead.acquire(["a", "b"]) == ["a", "b"]
+    assert alive.acquire(["a", "b"]) == []
+    time.sleep(.3)
+    assert alive.acquire(["a", "b"]) == ["a", "b"]
+
+
+def test_restarted_worker_drops_its_leases(tmp_path):
+    crashed = Leases(str(tmp_path / "crawl.db"), worker="w1", ttl=.2)
+    assert crashed.acquire(["a", "b"]) == ["a", "b"]
+    crashed.finish(["a"], cooldown=600)
+    # restarted under the same name before the ttl, heartbeating
+    restarted = Leases(str(tmp_path / "crawl.db"), worker="w1", ttl=.2)
+    restarted.heartbeat()
+    time.sleep(.3)
+    restarted.heartbeat()
+    restarted.purge()
+    other = Leases(str(tmp_path / "crawl.db"), worker="w2", ttl=.2)
+    # the running lease of the crashed process is free again, the finished one is not
+    assert other.acquire(["a", "b"]) == ["b"]